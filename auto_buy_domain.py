@@ -6,7 +6,6 @@ Script automatique pour acheter silencut.com et le configurer
 import os
 import sys
 import time
-import requests
 import subprocess
 
 def check_availability():
@@ -9,16 +9,67 @@ import subprocess
 import sys
 import tempfile
 import gc  # Pour forcer le nettoyage mémoire
+import itertools
 import os
 from pathlib import Path
-from typing import List, Tuple
+from typing import BinaryIO, Callable, Iterable, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import numpy as np
-import librosa
+from scipy.ndimage import binary_opening, binary_closing
+
+from cut_silence_ffmpeg import run_ffmpeg
+
+try:
+    import numpy_rms  # RMS fenêtré en C/SIMD (optionnel)
+except ImportError:
+    numpy_rms = None
+
+try:
+    from numba import njit  # Compilation des boucles hystérésis/morphologie (optionnel)
+except ImportError:
+    njit = None
 
 # Limiter l'usage mémoire
 os.environ['OMP_NUM_THREADS'] = '1'
-import soundfile as sf
+
+# Taille des lectures sur le pipe de décodage FFmpeg
+PIPE_BUFFER_SIZE = 10 * 1024 * 1024
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _squash_runs_inplace(mask, min_len, value):
+        """Inverse sur place les runs de `value` plus courts que min_len."""
+        n = len(mask)
+        i = 0
+        while i < n:
+            if mask[i] != value:
+                i += 1
+                continue
+            j = i
+            while j < n and mask[j] == value:
+                j += 1
+            if j - i < min_len:
+                mask[i:j] = not value
+            i = j
+
+    @njit(cache=True)
+    def _hysteresis_and_morph(db, enter_db, exit_db, min_noise_frames, min_silence_frames):
+        """Hystérésis puis ouverture/fermeture, en une seule fonction compilée."""
+        mask = np.empty(len(db), dtype=np.bool_)
+        in_silence = True
+        for i in range(len(db)):
+            if in_silence and db[i] > exit_db:
+                in_silence = False
+            elif (not in_silence) and db[i] < enter_db:
+                in_silence = True
+            mask[i] = not in_silence
+        _squash_runs_inplace(mask, min_noise_frames, True)
+        _squash_runs_inplace(mask, min_silence_frames, False)
+        return mask
+else:
+    _hysteresis_and_morph = None
 
 
 class SilenceDetector:
@@ -42,165 +93,287 @@ class SilenceDetector:
         
         self.enter_silence_db = threshold_db - hysteresis_db
         self.exit_silence_db = threshold_db + hysteresis_db
+        
+        self.total_duration = None  # Durée de l'audio décodé par process()
     
-    def extract_audio(self, input_file: str, temp_wav: str) -> None:
-        """Extrait l'audio en mono 48kHz pour la détection."""
-        cmd = [
-            'ffmpeg', '-i', input_file,
-            '-vn', '-ac', '1', '-ar', '48000',
-            '-c:a', 'pcm_s16le', temp_wav,
-            '-y', '-loglevel', 'error'
-        ]
-        subprocess.run(cmd, check=True)
-    
-    def detect_activity(self, audio_path: str, sr: int = 16000) -> np.ndarray:
-        """Détecte l'activité vocale avec RMS et hystérésis."""
-        print(f"Chargement de l'audio (SR={sr}Hz pour économiser la RAM)...")
-        y, _ = librosa.load(audio_path, sr=sr, mono=True)
-        duration = len(y) / sr
-        gc.collect()
+    def stream_frame_levels(self, stream: BinaryIO, sr: int) -> Tuple[np.ndarray, float, float]:
+        """Calcule le niveau RMS (dBFS) de chaque fenêtre, en lisant le PCM int16
+        par blocs depuis un flux.
         
+        Retourne (niveaux, durée d'un hop, durée totale) en secondes. La RAM
+        utilisée reste proportionnelle à la taille d'un bloc, quelle que soit
+        la durée de la vidéo.
+        """
         win = int(self.window_ms * sr / 1000)
         hop = int(self.hop_ms * sr / 1000)
+        n_samples = 0
         
-        print(f"Calcul du RMS (fenêtre={win}, hop={hop})...")
-        rms = librosa.feature.rms(y=y, frame_length=win, hop_length=hop, center=True)[0]
-        db = 20 * np.log10(rms + 1e-9)
+        def read_chunks():
+            nonlocal n_samples
+            while chunk := stream.read(PIPE_BUFFER_SIZE):
+                samples = np.frombuffer(chunk, dtype=np.int16)
+                n_samples += len(samples)
+                yield samples
         
-        print(f"Application de l'hystérésis (entrée={self.enter_silence_db:.1f}dB, sortie={self.exit_silence_db:.1f}dB)...")
-        mask_voice = np.zeros_like(db, dtype=bool)
-        in_silence = True
+        print(f"Calcul du RMS par blocs (fenêtre={win}, hop={hop})...")
+        db = self._chunked_frame_db(read_chunks(), win, hop)
+        return db, hop / sr, n_samples / sr
+    
+    def _chunked_frame_db(self, chunks: Iterable[np.ndarray], win: int, hop: int) -> np.ndarray:
+        """Niveaux par fenêtre d'un signal découpé en blocs successifs.
         
-        for i, d in enumerate(db):
-            if in_silence and d > self.exit_silence_db:
-                in_silence = False
-            elif (not in_silence) and d < self.enter_silence_db:
-                in_silence = True
-            mask_voice[i] = not in_silence
+        Les échantillons d'une fenêtre à cheval sur deux blocs sont reportés
+        sur le bloc suivant. Le padding centré de win//2 zéros de chaque côté
+        équivaut à center=True de librosa (pad constant).
+        """
+        pad = np.zeros(win // 2, dtype=np.int16)
+        carry = pad
+        levels = []
+        
+        for samples in itertools.chain(chunks, [pad]):
+            buf = np.concatenate([carry, samples])
+            n_frames = (len(buf) - win) // hop + 1 if len(buf) >= win else 0
+            if n_frames > 0:
+                levels.append(self._frame_db(buf[:(n_frames - 1) * hop + win], win, hop))
+                carry = buf[n_frames * hop:]
+            else:
+                carry = buf
         
-        del y  # Libérer la mémoire de l'audio
-        gc.collect()
-        return mask_voice, hop / sr, duration
+        return np.concatenate(levels) if levels else np.zeros(0, dtype=np.float32)
     
-    def apply_morphology(self, mask: np.ndarray, hop_duration: float) -> np.ndarray:
-        """Applique la morphologie temporelle (fermeture/ouverture)."""
+    def hysteresis(self, db: np.ndarray) -> np.ndarray:
+        """Applique l'hystérésis aux niveaux des fenêtres."""
+        print(f"Application de l'hystérésis (entrée={self.enter_silence_db:.1f}dB, sortie={self.exit_silence_db:.1f}dB)...")
+        # Transitions: +1 au-dessus du seuil de sortie, -1 sous le seuil d'entrée,
+        # 0 entre les deux (on garde l'état précédent, silence au départ)
+        code = (db > self.exit_silence_db).astype(np.int8) - (db < self.enter_silence_db)
+        idx = np.where(code != 0, np.arange(len(code)), 0)
+        np.maximum.accumulate(idx, out=idx)
+        return code[idx] > 0
+    
+    def _frame_db(self, y: np.ndarray, win: int, hop: int) -> np.ndarray:
+        """Niveau en dBFS de chaque fenêtre complète d'un signal int16."""
+        if numpy_rms is not None and win % hop == 0:
+            # numpy_rms ne calcule que des fenêtres disjointes: RMS par blocs
+            # de `hop` échantillons, puis puissance moyenne sur win/hop blocs
+            k = win // hop
+            n_blocks = (len(y) - win) // hop + k
+            block_rms = numpy_rms.rms(y[:n_blocks * hop].astype(np.float32), window_size=hop)
+            power = np.lib.stride_tricks.sliding_window_view(
+                np.square(block_rms, dtype=np.float64), window_shape=k
+            ).mean(axis=1)
+            return 10 * np.log10(power / 32768.0 ** 2 + 1e-18)
+        
+        # Signal élevé au carré une seule fois (int32 suffit: 32768² < 2³¹),
+        # puis sommes entières par fenêtre sur un accumulateur int64
+        y2 = np.multiply(y, y, dtype=np.int32)
+        frames = np.lib.stride_tricks.sliding_window_view(y2, window_shape=win)[::hop]
+        sums = frames.sum(axis=1, dtype=np.int64)
+        # 10*log10 de la puissance = 20*log10 du RMS (pas de sqrt), en pleine échelle
+        return 10 * np.log10(sums.astype(np.float32) / (win * 32768.0 ** 2) + 1e-18)
+    
+    def _morphology_frames(self, hop_duration: float) -> Tuple[int, int]:
+        """Convertit les durées min de bruit/silence en nombres de fenêtres."""
         min_noise_frames = int(np.ceil(self.min_noise_ms / 1000 / hop_duration))
         min_silence_frames = int(np.ceil(self.min_silence_ms / 1000 / hop_duration))
         
         print(f"Morphologie: suppression bruits <{self.min_noise_ms}ms ({min_noise_frames} frames)")
         print(f"Morphologie: conservation silences <{self.min_silence_ms}ms ({min_silence_frames} frames)")
+        return min_noise_frames, min_silence_frames
+    
+    def apply_morphology(self, mask: np.ndarray, hop_duration: float) -> np.ndarray:
+        """Applique la morphologie temporelle (fermeture/ouverture)."""
+        min_noise_frames, min_silence_frames = self._morphology_frames(hop_duration)
+        
+        # Ouverture: supprime les runs de voix plus courts que min_noise_frames
+        if min_noise_frames > 1:
+            mask = binary_opening(mask, structure=np.ones(min_noise_frames, dtype=bool))
         
-        mask = self._squash_short_runs(mask, min_noise_frames, True)
-        mask = self._squash_short_runs(mask, min_silence_frames, False)
+        # Fermeture: comble les silences plus courts que min_silence_frames.
+        # Bords remplis de True pour que les silences en début/fin soient traités
+        # comme les autres (la fermeture de scipy érode sinon les extrémités).
+        if min_silence_frames > 1:
+            k = min_silence_frames
+            padded = np.pad(mask, k, constant_values=True)
+            mask = binary_closing(padded, structure=np.ones(k, dtype=bool))[k:-k]
         
         return mask
     
-    def _squash_short_runs(self, mask: np.ndarray, min_len: int, value: bool) -> np.ndarray:
-        """Supprime les runs courts d'une valeur donnée."""
-        m = mask.copy()
-        n = len(m)
-        i = 0
+    def mask_to_intervals(
+        self, mask: np.ndarray, hop_duration: float, total_duration: float,
+        keyframe_times: Optional[np.ndarray] = None
+    ) -> List[Tuple[float, float]]:
+        """Convertit le masque binaire en intervalles temporels à garder.
         
-        while i < n:
-            j = i
-            while j < n and m[j] == value:
-                j += 1
-            
-            run_length = j - i
-            if run_length > 0 and run_length < min_len:
-                m[i:j] = not value
+        Si keyframe_times est fourni, chaque début est ramené à l'image clé
+        précédente (sauf s'il déborderait sur l'intervalle précédent) et chaque
+        fin repoussée à l'image clé suivante (sauf si elle déborderait sur
+        l'intervalle suivant), pour que le rendu puisse copier des GOP entiers
+        sans ré-encodage. Un début non calé garde sa coupe de silence; le rendu
+        ré-encode alors (voir is_keyframe_aligned).
+        """
+        margin = self.margin_ms / 1000
+        
+        # Fronts montants/descendants du masque = début/fin des runs de voix
+        d = np.diff(np.r_[0, mask.astype(np.int8), 0])
+        starts = np.flatnonzero(d == 1)
+        ends = np.flatnonzero(d == -1)
+        
+        start_t = np.maximum(0.0, starts * hop_duration - margin)
+        end_t = np.minimum(total_duration, ends * hop_duration + margin)
+        
+        keep = end_t > start_t
+        start_t, end_t = start_t[keep], end_t[keep]
+        
+        if keyframe_times is not None and len(keyframe_times) and len(start_t):
+            idx = np.searchsorted(keyframe_times, start_t, side='right') - 1
+            snapped = keyframe_times[np.maximum(idx, 0)]
+            prev_end = np.r_[-np.inf, end_t[:-1]]
+            snap = (idx >= 0) & (snapped >= prev_end)
+            skipped = int(np.count_nonzero(idx >= 0) - np.count_nonzero(snap))
+            if skipped:
+                print(f"⚠️ {skipped}/{len(start_t)} débuts non calés sur une image clé "
+                      f"(elle tomberait dans le segment gardé précédent)")
+            start_t = np.where(snap, snapped, start_t)
             
-            i = j if j > i else i + 1
+            idx = np.searchsorted(keyframe_times, end_t, side='left')
+            snapped = keyframe_times[np.minimum(idx, len(keyframe_times) - 1)]
+            next_start = np.r_[start_t[1:], total_duration]
+            end_t = np.where((idx < len(keyframe_times)) & (snapped <= next_start), snapped, end_t)
         
-        return m
+        return list(zip(start_t.tolist(), end_t.tolist()))
     
-    def mask_to_intervals(
-        self, mask: np.ndarray, hop_duration: float, total_duration: float
+    def process(
+        self, input_file: str, sr: int = 16000, keyframe_times: Optional[np.ndarray] = None,
+        preview_seconds: Optional[float] = None
     ) -> List[Tuple[float, float]]:
-        """Convertit le masque binaire en intervalles temporels à garder."""
-        times = np.arange(len(mask)) * hop_duration
-        intervals = []
-        i = 0
+        """Traite un fichier et retourne les intervalles à garder.
         
-        while i < len(mask):
-            if mask[i]:
-                j = i + 1
-                while j < len(mask) and mask[j]:
-                    j += 1
-                
-                start = max(0.0, times[i] - self.margin_ms / 1000)
-                end = min(times[j-1] + hop_duration + self.margin_ms / 1000, total_duration)
-                
-                if end > start:
-                    intervals.append((start, end))
-                i = j
-            else:
-                i += 1
+        Si preview_seconds est fourni, seul ce début de l'audio est décodé
+        et analysé.
+        """
+        # Décodage direct en PCM int16 mono via un pipe FFmpeg (pas de WAV
+        # temporaire). Le RMS est calculé en entiers, sans conversion float.
+        # 16kHz au lieu de 48kHz pour économiser la RAM
+        print(f"Extraction de l'audio de {input_file} (SR={sr}Hz)...")
+        cmd = [
+            'ffmpeg', '-i', input_file,
+            '-vn', '-ac', '1', '-ar', str(sr),
+            '-f', 's16le', '-acodec', 'pcm_s16le',
+            '-loglevel', 'error', '-'
+        ]
+        if preview_seconds is not None:
+            cmd[-1:-1] = ['-t', f"{preview_seconds:.3f}"]
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=PIPE_BUFFER_SIZE)
+        # RMS calculé au fil du décodage: l'audio complet n'est jamais en RAM
+        db, hop_duration, total_duration = self.stream_frame_levels(proc.stdout, sr)
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+        self.total_duration = total_duration
+        gc.collect()  # Nettoyer après l'analyse
+        
+        if _hysteresis_and_morph is not None:
+            # Hystérésis + morphologie dans une seule boucle compilée par Numba
+            print(f"Hystérésis + morphologie (Numba, entrée={self.enter_silence_db:.1f}dB, sortie={self.exit_silence_db:.1f}dB)...")
+            mask = _hysteresis_and_morph(
+                db, self.enter_silence_db, self.exit_silence_db,
+                *self._morphology_frames(hop_duration)
+            )
+        else:
+            mask = self.apply_morphology(self.hysteresis(db), hop_duration)
+        
+        intervals = self.mask_to_intervals(mask, hop_duration, total_duration, keyframe_times)
         
         return intervals
-    
-    def process(self, input_file: str) -> List[Tuple[float, float]]:
-        """Traite un fichier et retourne les intervalles à garder."""
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp:
-            temp_wav = tmp.name
-        
-        try:
-            print(f"Extraction de l'audio de {input_file}...")
-            self.extract_audio(input_file, temp_wav)
-            
-            # Utiliser 16kHz au lieu de 48kHz pour économiser la RAM
-            mask, hop_duration, total_duration = self.detect_activity(temp_wav)
-            gc.collect()  # Nettoyer après l'analyse
-            
-            mask = self.apply_morphology(mask, hop_duration)
-            
-            intervals = self.mask_to_intervals(mask, hop_duration, total_duration)
-            
-            return intervals
-            
-        finally:
-            Path(temp_wav).unlink(missing_ok=True)
 
 
 class VideoProcessor:
-    def __init__(self, crf: int = 18, audio_bitrate: str = '192k'):
+    # Nombre max d'intervalles rendus via un seul filter_complex
+    MAX_FILTER_INTERVALS = 500
+    # En dessous de cette durée gardée (s), un seul process FFmpeg coûte moins
+    # cher que le lancement d'un encodeur par segment + la concaténation
+    MIN_PARALLEL_DURATION = 60.0
+    # Cadence de la vidéo rendue
+    OUTPUT_FPS = 30
+    
+    def __init__(self, crf: int = 18, audio_bitrate: str = '192k', workers: Optional[int] = None):
         self.crf = crf
         self.audio_bitrate = audio_bitrate
+        # Nombre d'encodages de segments en parallèle (1 = un seul graphe FFmpeg)
+        self.workers = workers or os.cpu_count() or 1
     
-    def generate_filter_complex(self, intervals: List[Tuple[float, float]]) -> str:
-        """Génère le filter_complex pour FFmpeg."""
+    def generate_filter_complex(self, intervals: List[Tuple[float, float]], video: bool = True) -> str:
+        """Génère le filter_complex pour FFmpeg (audio seul si video=False)."""
         if not intervals:
             raise ValueError("Aucun intervalle à garder!")
         
-        filters = []
-        outputs = []
+        starts = np.array([start for start, _ in intervals])
+        ends = np.array([end for _, end in intervals])
+        fade_out = ends - starts - 0.003
         
-        for i, (start, end) in enumerate(intervals):
-            duration = end - start
-            # Pas de fade vidéo pour éviter les flashs noirs
-            # Micro-fades audio (3ms) pour éviter les clics aux transitions
-            filters.append(f"[0:v]trim=start={start:.3f}:end={end:.3f},setpts=PTS-STARTPTS[v{i}]")
-            filters.append(f"[0:a]atrim=start={start:.3f}:end={end:.3f},asetpts=PTS-STARTPTS,afade=t=in:st=0:d=0.003,afade=t=out:st={duration-0.003:.3f}:d=0.003[a{i}]")
-            outputs.extend([f"[v{i}]", f"[a{i}]"])
+        # Pas de fade vidéo pour éviter les flashs noirs
+        # Micro-fades audio (3ms) pour éviter les clics aux transitions
+        audio = (
+            "[0:a]atrim=start=%.6f:end=%.6f,asetpts=PTS-STARTPTS,"
+            "afade=t=in:st=0:d=0.003,afade=t=out:st=%.6f:d=0.003[a%d];"
+        )
+        if not video:
+            filters = "".join(
+                audio % (start, end, fade, i)
+                for i, (start, end, fade) in enumerate(zip(starts.tolist(), ends.tolist(), fade_out.tolist()))
+            )
+            outputs = "".join("[a%d]" % i for i in range(len(intervals)))
+            return "%s%sconcat=n=%d:v=0:a=1[a]" % (filters, outputs, len(intervals))
         
-        concat = f"{''.join(outputs)}concat=n={len(intervals)}:v=1:a=1[v][a]"
-        filters.append(concat)
+        segment = "[0:v]trim=start=%.3f:end=%.3f,setpts=PTS-STARTPTS[v%d];" + audio
+        filters = "".join(
+            segment % (start, end, i, start, end, fade, i)
+            for i, (start, end, fade) in enumerate(zip(starts.tolist(), ends.tolist(), fade_out.tolist()))
+        )
+        outputs = "".join("[v%d][a%d]" % (i, i) for i in range(len(intervals)))
         
-        return ';'.join(filters)
+        return "%s%sconcat=n=%d:v=1:a=1[v][a]" % (filters, outputs, len(intervals))
     
-    def render(self, input_file: str, output_file: str, intervals: List[Tuple[float, float]]) -> None:
-        """Effectue le rendu final avec FFmpeg."""
+    def render(
+        self, input_file: str, output_file: str, intervals: List[Tuple[float, float]],
+        keyframe_times: Optional[np.ndarray] = None,
+        progress_cb: Optional[Callable[[float], None]] = None
+    ) -> None:
+        """Effectue le rendu final avec FFmpeg.
+        
+        Si keyframe_times est fourni et que tous les intervalles commencent sur
+        une image clé, les segments sont copiés sans ré-encodage.
+        progress_cb reçoit la fraction de la durée de sortie déjà produite (0-1).
+        """
         if not intervals:
             print("Aucun intervalle à garder - le fichier serait vide!")
             return
         
+        if keyframe_times is not None:
+            if is_keyframe_aligned(intervals, keyframe_times):
+                self.render_segments(input_file, output_file, intervals, copy=True, progress_cb=progress_cb)
+                return
+            print("Intervalles non alignés sur les images clés: ré-encodage")
+        
+        # Au-delà de MAX_FILTER_INTERVALS, le filter_complex devient énorme et
+        # lent à parser: on passe par les segments + concat demuxer.
+        # Les vidéos courtes restent en une seule invocation FFmpeg.
+        kept_duration = sum(end - start for start, end in intervals)
+        parallel = (
+            self.workers > 1 and len(intervals) > 1
+            and kept_duration >= self.MIN_PARALLEL_DURATION
+        )
+        if len(intervals) > self.MAX_FILTER_INTERVALS or parallel:
+            self.render_segments(input_file, output_file, intervals, progress_cb=progress_cb)
+            return
+        
         filter_complex = self.generate_filter_complex(intervals)
         
         cmd = [
             'ffmpeg', '-i', input_file,
             '-filter_complex', filter_complex,
             '-map', '[v]', '-map', '[a]',
-            '-r', '30', '-g', '30',
+            '-r', str(self.OUTPUT_FPS), '-g', str(self.OUTPUT_FPS),
             '-c:v', 'libx264', '-crf', str(self.crf),
             '-c:a', 'aac', '-b:a', self.audio_bitrate,
             '-movflags', '+faststart',
@@ -209,7 +382,141 @@ class VideoProcessor:
         ]
         
         print(f"Rendu de la vidéo finale...")
+        run_ffmpeg(cmd, kept_duration, progress_cb)
+    
+    def encode_segment(
+        self, input_file: str, segment_file: str, start: float, end: float, copy: bool = False
+    ) -> None:
+        """Encode (ou copie, si copy=True) la vidéo d'un seul intervalle dans son propre fichier.
+        
+        Pas d'audio: chaque encodage AAC ajouterait ses échantillons d'amorce
+        à la jonction, et l'audio dériverait de la vidéo à chaque coupe.
+        """
+        duration = end - start
+        if copy:
+            # -ss avant -i: recherche sur l'image clé du début (marge de 0.5ms
+            # pour ne pas retomber sur l'image clé précédente à l'arrondi).
+            # La même marge retirée de -t exclut l'image clé de fin, qui
+            # ouvre le segment suivant
+            cmd = [
+                'ffmpeg', '-ss', f"{start + 0.0005:.4f}", '-i', input_file,
+                '-t', f"{duration - 0.001:.4f}",
+                '-map', '0:v:0', '-c', 'copy', '-avoid_negative_ts', 'make_zero',
+                segment_file,
+                '-y', '-loglevel', 'error'
+            ]
+            subprocess.run(cmd, check=True)
+            return
+        
+        # Nombre d'images exact: la durée du segment est celle que la piste audio
+        # reprend pour cet intervalle (voir render_segments)
+        cmd = [
+            'ffmpeg', '-ss', f"{start:.6f}", '-i', input_file,
+            '-map', '0:v:0', '-frames:v', str(round(duration * self.OUTPUT_FPS)),
+            '-r', str(self.OUTPUT_FPS), '-g', str(self.OUTPUT_FPS),
+            # Un thread par encodeur: le parallélisme vient des segments
+            '-c:v', 'libx264', '-crf', str(self.crf), '-threads', '1',
+            segment_file,
+            '-y', '-loglevel', 'error'
+        ]
         subprocess.run(cmd, check=True)
+    
+    def encode_audio(
+        self, input_file: str, audio_file: str, intervals: List[Tuple[float, float]], script_file: str
+    ) -> None:
+        """Encode en une seule passe l'audio de tous les intervalles mis bout à bout."""
+        # Graphe dans un fichier: avec des milliers d'intervalles il dépasse
+        # la taille maximale d'un argument de ligne de commande
+        Path(script_file).write_text(self.generate_filter_complex(intervals, video=False))
+        cmd = [
+            'ffmpeg', '-i', input_file,
+            '-filter_complex_script', script_file,
+            '-map', '[a]',
+            '-c:a', 'aac', '-b:a', self.audio_bitrate,
+            audio_file,
+            '-y', '-loglevel', 'error'
+        ]
+        subprocess.run(cmd, check=True)
+    
+    def render_segments(
+        self, input_file: str, output_file: str, intervals: List[Tuple[float, float]],
+        copy: bool = False, progress_cb: Optional[Callable[[float], None]] = None
+    ) -> None:
+        """Encode la vidéo des segments en parallèle, l'audio en une passe, puis
+        concatène et multiplexe le tout sans ré-encodage."""
+        if not copy:
+            # Fins arrondies à l'image: l'audio reprend exactement la durée
+            # de chaque segment vidéo, sans dérive cumulée
+            intervals = [
+                (start, start + max(1, round((end - start) * self.OUTPUT_FPS)) / self.OUTPUT_FPS)
+                for start, end in intervals
+            ]
+        
+        with tempfile.TemporaryDirectory(prefix='silencut_') as tmp_dir:
+            segment_files = [str(Path(tmp_dir) / f"seg_{i:05d}.mp4") for i in range(len(intervals))]
+            audio_file = str(Path(tmp_dir) / 'audio.m4a')
+            
+            print(f"Rendu de {len(intervals)} segments ({self.workers} en parallèle)...")
+            kept_duration = sum(end - start for start, end in intervals)
+            done_duration = 0.0
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                audio_future = pool.submit(
+                    self.encode_audio, input_file, audio_file, intervals,
+                    str(Path(tmp_dir) / 'audio_filter.txt')
+                )
+                futures = {
+                    pool.submit(self.encode_segment, input_file, segment_file, start, end, copy): end - start
+                    for segment_file, (start, end) in zip(segment_files, intervals)
+                }
+                # Progression par segment terminé (la concaténation est quasi instantanée)
+                for future in as_completed(futures):
+                    future.result()
+                    done_duration += futures[future]
+                    if progress_cb is not None and kept_duration > 0:
+                        progress_cb(done_duration / kept_duration)
+                audio_future.result()
+            
+            concat_list = Path(tmp_dir) / 'concat.txt'
+            concat_list.write_text(''.join(f"file '{f}'\n" for f in segment_files))
+            
+            cmd = [
+                'ffmpeg', '-f', 'concat', '-safe', '0', '-i', str(concat_list),
+                '-i', audio_file,
+                '-map', '0:v', '-map', '1:a',
+                '-c', 'copy',
+                '-movflags', '+faststart',
+                output_file,
+                '-y', '-loglevel', 'error'
+            ]
+            print(f"Concaténation des segments...")
+            subprocess.run(cmd, check=True)
+
+
+def get_keyframe_times(input_file: str) -> np.ndarray:
+    """Retourne les instants (s) des images clés du premier flux vidéo."""
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0', '-skip_frame', 'nokey',
+        '-show_entries', 'frame=pts_time',
+        '-of', 'csv=p=0', input_file
+    ]
+    output = subprocess.check_output(cmd).decode()
+    times = [line.split(',')[0] for line in output.split()]
+    return np.array(sorted(float(t) for t in times if t and t != 'N/A'))
+
+
+def is_keyframe_aligned(
+    intervals: List[Tuple[float, float]], keyframe_times: np.ndarray, tolerance: float = 1e-3
+) -> bool:
+    """Vérifie que chaque intervalle commence sur une image clé."""
+    if len(keyframe_times) == 0:
+        return False
+    starts = np.array([start for start, _ in intervals])
+    idx = np.clip(np.searchsorted(keyframe_times, starts), 1, len(keyframe_times) - 1)
+    nearest = np.minimum(
+        np.abs(keyframe_times[idx] - starts), np.abs(keyframe_times[idx - 1] - starts)
+    )
+    return bool(np.all(nearest <= tolerance))
 
 
 def format_time(seconds: float) -> str:
@@ -270,11 +577,31 @@ Exemples:
         type=str, default='192k',
         help='Bitrate audio (défaut: 192k)'
     )
+    parser.add_argument(
+        '--workers', '-j',
+        type=int, default=None,
+        help='Segments encodés en parallèle (défaut: nombre de CPU, 1=rendu en une passe)'
+    )
+    parser.add_argument(
+        '--keyframe-snap',
+        action='store_true',
+        help='Caler les coupes sur les images clés de la vidéo'
+    )
+    parser.add_argument(
+        '--stream-copy',
+        action='store_true',
+        help='Copier les flux sans ré-encodage (implique --keyframe-snap)'
+    )
     parser.add_argument(
         '--export-intervals',
         type=str,
         help='Exporter les intervalles dans un fichier texte'
     )
+    parser.add_argument(
+        '--preview',
+        type=float, metavar='SECONDES',
+        help='Analyser seulement les N premières secondes (aperçu rapide)'
+    )
     parser.add_argument(
         '--dry-run',
         action='store_true',
@@ -308,7 +635,14 @@ Exemples:
     )
     
     try:
-        intervals = detector.process(args.input)
+        keyframe_times = None
+        if args.keyframe_snap or args.stream_copy:
+            print("Recherche des images clés...")
+            keyframe_times = get_keyframe_times(args.input)
+        
+        intervals = detector.process(
+            args.input, keyframe_times=keyframe_times, preview_seconds=args.preview
+        )
         
         if not intervals:
             print("\nAucun segment audio détecté! Vérifiez vos paramètres.")
@@ -321,9 +655,8 @@ Exemples:
             total_kept += duration
             print(f"  Segment {i:3d}: {format_time(start)} → {format_time(end)} ({duration:.3f}s)")
         
-        cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
-               '-of', 'default=noprint_wrappers=1:nokey=1', args.input]
-        original_duration = float(subprocess.check_output(cmd).decode().strip())
+        # Durée déjà connue grâce au décodage (pas de ffprobe supplémentaire)
+        original_duration = detector.total_duration
         
         reduction = (1 - total_kept / original_duration) * 100
         print(f"\nDurée originale: {format_time(original_duration)}")
@@ -337,8 +670,11 @@ Exemples:
             print(f"\nIntervalles exportés dans: {args.export_intervals}")
         
         if not args.dry_run:
-            processor = VideoProcessor(crf=args.crf, audio_bitrate=args.audio_bitrate)
-            processor.render(args.input, args.output, intervals)
+            processor = VideoProcessor(crf=args.crf, audio_bitrate=args.audio_bitrate, workers=args.workers)
+            processor.render(
+                args.input, args.output, intervals,
+                keyframe_times=keyframe_times if args.stream_copy else None
+            )
             print(f"\nVidéo générée: {args.output}")
         else:
             print("\nMode dry-run: aucune vidéo générée")
@@ -8,7 +8,34 @@ import subprocess
 import re
 import json
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, List, Optional, Tuple
+
+
+def run_ffmpeg(cmd: List[str], total_duration: float,
+               progress_cb: Optional[Callable[[float], None]] = None) -> None:
+    """Lance FFmpeg; si progress_cb est fourni, lui transmet la fraction encodée (0-1).
+    
+    La progression est lue sur stdout via -progress (lignes clé=valeur),
+    stderr reste le journal habituel de FFmpeg.
+    """
+    if progress_cb is None:
+        subprocess.run(cmd, check=True)
+        return
+    
+    cmd = [cmd[0], '-progress', 'pipe:1', '-nostats', *cmd[1:]]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    for line in proc.stdout:
+        key, _, value = line.partition('=')
+        if key == 'out_time_us' and total_duration > 0:
+            try:
+                out_time = int(value) / 1e6
+            except ValueError:  # "N/A" avant la première image
+                continue
+            progress_cb(min(max(out_time / total_duration, 0.0), 1.0))
+    
+    if proc.wait() != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
 
 class FFmpegSilenceDetector:
     def __init__(
@@ -86,7 +113,8 @@ class FFmpegVideoProcessor:
         self.crf = crf
         self.audio_bitrate = audio_bitrate
     
-    def render(self, input_file: str, output_file: str, segments: List[Tuple[float, float]]):
+    def render(self, input_file: str, output_file: str, segments: List[Tuple[float, float]],
+               progress_cb: Optional[Callable[[float], None]] = None):
         """Génère la vidéo finale avec FFmpeg uniquement"""
         if not segments:
             raise ValueError("Aucun segment à traiter")
@@ -123,7 +151,7 @@ class FFmpegVideoProcessor:
             '-y', output_file
         ]
         
-        subprocess.run(cmd, check=True)
+        run_ffmpeg(cmd, sum(end - start for start, end in segments), progress_cb)
 
 
 # Fonction principale pour compatibilité
@@ -7,7 +7,18 @@ Utilise des paramètres plus agressifs pour la vitesse
 import subprocess
 import re
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, List, Optional, Tuple
+
+from cut_silence_ffmpeg import run_ffmpeg
+
+# Analyse minimale de l'entrée, partagée par la détection et le rendu
+FAST_PROBE_ARGS = ['-analyzeduration', '0', '-probesize', '32k']
+
+# Lignes "silence_start: X" / "silence_end: Y" émises par silencedetect
+SILENCE_RE = re.compile(r'silence_(start|end): ([\d.]+)')
+# En-tête d'entrée "Duration: HH:MM:SS.xx" (évite un appel ffprobe)
+DURATION_RE = re.compile(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)')
+
 
 class FFmpegSilenceDetectorFast:
     def __init__(
@@ -19,6 +30,7 @@ class FFmpegSilenceDetectorFast:
         self.threshold_db = threshold_db
         self.min_silence_duration = min_silence_duration
         self.margin_s = margin_ms / 1000.0
+        self.duration = None  # Durée lue dans l'en-tête lors de la détection
     
     def detect_silence(self, input_file: str) -> List[Tuple[float, float]]:
         """Détecte les silences avec FFmpeg - version rapide"""
@@ -26,7 +38,7 @@ class FFmpegSilenceDetectorFast:
             'ffmpeg',
             '-hide_banner', '-nostats',
             # Analyse minimale pour vitesse max
-            '-analyzeduration', '0', '-probesize', '32k',
+            *FAST_PROBE_ARGS,
             '-threads', '1',
             '-vn', '-sn', '-dn',
             '-i', input_file,
@@ -34,28 +46,38 @@ class FFmpegSilenceDetectorFast:
             '-f', 'null', '-'
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        # Parser la sortie pour extraire les segments de silence
-        silence_starts = re.findall(r'silence_start: ([\d.]+)', result.stderr)
-        silence_ends = re.findall(r'silence_end: ([\d.]+)', result.stderr)
-        
-        silences = []
-        for start, end in zip(silence_starts, silence_ends):
-            silences.append((float(start), float(end)))
-        
-        return silences
+        # Lecture de stderr ligne par ligne pour ne pas tout garder en mémoire
+        silence_starts = []
+        silence_ends = []
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        self.duration = None
+        for line in proc.stderr:
+            if self.duration is None:
+                duration_match = DURATION_RE.search(line)
+                if duration_match:
+                    hours, minutes, seconds = duration_match.groups()
+                    self.duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+            for match in SILENCE_RE.finditer(line):
+                if match.group(1) == 'start':
+                    silence_starts.append(float(match.group(2)))
+                else:
+                    silence_ends.append(float(match.group(2)))
+        proc.wait()
+        
+        return list(zip(silence_starts, silence_ends))
     
     def get_audio_segments(self, input_file: str) -> List[Tuple[float, float]]:
         """Retourne les segments audio (inverse des silences)"""
-        # Obtenir la durée totale
-        cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
-               '-of', 'default=noprint_wrappers=1:nokey=1', input_file]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        duration = float(result.stdout.strip())
-        
-        # Obtenir les silences
+        # Obtenir les silences (et la durée totale, lue dans la même passe)
         silences = self.detect_silence(input_file)
+        duration = self.duration
+        
+        if duration is None:
+            # Durée absente de l'en-tête (N/A): repli sur ffprobe
+            cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+                   '-of', 'default=noprint_wrappers=1:nokey=1', input_file]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            duration = float(result.stdout.strip())
         
         if not silences:
             return [(0, duration)]
@@ -86,7 +108,8 @@ class FFmpegVideoProcessorFast:
         self.crf = crf  # CRF plus élevé pour vitesse
         self.audio_bitrate = audio_bitrate  # Bitrate audio réduit
     
-    def render(self, input_file: str, output_file: str, segments: List[Tuple[float, float]]):
+    def render(self, input_file: str, output_file: str, segments: List[Tuple[float, float]],
+               progress_cb: Optional[Callable[[float], None]] = None):
         """Génère la vidéo finale avec FFmpeg - version rapide"""
         if not segments:
             raise ValueError("Aucun segment à traiter")
@@ -109,8 +132,8 @@ class FFmpegVideoProcessorFast:
         # Commande FFmpeg optimisée pour la vitesse
         cmd = [
             'ffmpeg',
-            # Analyse réduite pour vitesse max
-            '-analyzeduration', '10M', '-probesize', '10M',  # Réduit de 100M/50M
+            # Même analyse minimale que la détection (réduit de 10M/10M)
+            *FAST_PROBE_ARGS,
             # Entrée
             '-i', input_file,
             # Pas de parallélisme pour économiser la RAM
@@ -124,7 +147,7 @@ class FFmpegVideoProcessorFast:
             '-y', output_file
         ]
         
-        subprocess.run(cmd, check=True)
+        run_ffmpeg(cmd, sum(end - start for start, end in segments), progress_cb)
 
 
 # Fonction principale pour compatibilité
@@ -10,7 +10,7 @@ if [ -d "venv" ]; then
 fi
 
 # Installer les dépendances si nécessaire
-pip install fastapi uvicorn python-multipart aiofiles websockets 2>/dev/null || true
+pip install fastapi uvicorn streaming-form-data aiofiles orjson msgpack websockets 2>/dev/null || true
 
 # Créer les dossiers nécessaires
 mkdir -p webapp/uploads webapp/outputs webapp/temp
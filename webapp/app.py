@@ -7,20 +7,32 @@ import os
 import uuid
 import shutil
 import asyncio
+import hashlib
+import multiprocessing
+import re
+from urllib.parse import quote
+from contextlib import asynccontextmanager, nullcontext
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Set, Tuple
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
-from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse
+from fastapi import FastAPI, Request, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, HTMLResponse, ORJSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 import aiofiles
+import orjson
+from streaming_form_data import ParseFailedException, StreamingFormDataParser
+from streaming_form_data.targets import FileTarget
 
 # Import de notre module de traitement
 import sys
 import gc  # Garbage collector pour optimiser la mémoire
+import ctypes
 sys.path.append('..')
 
 # Limiter le parallélisme des libs natives (utile même si non utilisées)
@@ -29,6 +41,24 @@ os.environ.setdefault('OPENBLAS_NUM_THREADS', '1')
 os.environ.setdefault('MKL_NUM_THREADS', '1')
 os.environ.setdefault('NUMEXPR_NUM_THREADS', '1')
 
+# GC: seuils fixés une fois, plus de collectes complètes à chaque étape d'un job
+GC_THRESHOLDS = (700, 10, 5)
+gc.set_threshold(*GC_THRESHOLDS)
+
+# malloc_trim rend au système la mémoire libérée (glibc uniquement)
+try:
+    _libc = ctypes.CDLL("libc.so.6")
+except OSError:
+    _libc = None
+
+
+def release_memory():
+    """Collecte complète puis malloc_trim: à appeler en fin de job uniquement"""
+    gc.collect()
+    if _libc is not None:
+        _libc.malloc_trim(0)
+
+
 # Utiliser la version FFmpeg légère pour économiser la RAM
 try:
     from cut_silence_ffmpeg import FFmpegSilenceDetector as SilenceDetector
@@ -45,7 +75,32 @@ sys.path.insert(0, current_dir)
 from persist_jobs import save_jobs, load_jobs
 from daily_stats import track_page_view, track_video_processed, track_upload, track_error, get_stats_summary
 
-app = FastAPI(title="SilenCut API", version="1.1.0")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Démarre le pool de rendu et les workers de traitement, les stoppe à l'arrêt"""
+    # Reprendre les jobs restés en file d'attente avant un redémarrage
+    for job_id, job in jobs.items():
+        if job.get("status") == "pending" and job.get("params"):
+            job_queue.put_nowait((job_id, ProcessRequest(**job["params"])))
+    
+    # Démarrer les processus de rendu maintenant plutôt qu'au premier job
+    await warm_render_pool()
+    
+    workers = [asyncio.create_task(processing_worker(slot)) for slot in range(MAX_CONCURRENT_JOBS)]
+    flusher = asyncio.create_task(jobs_flush_loop())
+    try:
+        yield
+    finally:
+        for worker in workers:
+            worker.cancel()
+        flusher.cancel()
+        RENDER_POOL.shutdown(wait=False, cancel_futures=True)
+        save_jobs(jobs)  # Dernière sauvegarde avant l'arrêt
+
+
+app = FastAPI(title="SilenCut API", version="1.1.0", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Configuration CORS
 app.add_middleware(
@@ -56,12 +111,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Profilage par requête (PROFILE=1): un rapport HTML pyinstrument par requête
+# dans PROFILE_DIR. Désactivé par défaut, aucun surcoût en production.
+if os.getenv("PROFILE"):
+    from pyinstrument import Profiler
+    
+    PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "/tmp/profiles"))
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        try:
+            return await call_next(request)
+        finally:
+            profiler.stop()
+            name = request.url.path.strip("/").replace("/", "_") or "index"
+            report = PROFILE_DIR / f"{name}_{datetime.now():%Y%m%d_%H%M%S_%f}.html"
+            report.write_text(profiler.output_html())
+
 # Configuration
 UPLOAD_DIR = Path("uploads")
 OUTPUT_DIR = Path("outputs")
 TEMP_DIR = Path("temp")
 MAX_FILE_SIZE = 300 * 1024 * 1024  # 300 MB (optimisé pour 512MB RAM)
+ALLOWED_SUFFIXES = frozenset({'.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4a', '.mp3', '.wav'})
+UPLOAD_WRITE_SIZE = 8 * 1024 * 1024  # Écritures disque de l'upload par blocs de 8 MB
 CLEANUP_AFTER_HOURS = 2
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB par lecture pour les réponses partielles
+STATIC_DIR = Path(__file__).parent / "static"
+STATIC_CACHE_CONTROL = "public, max-age=3600"
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
 
 # Créer les dossiers nécessaires
 for dir_path in [UPLOAD_DIR, OUTPUT_DIR, TEMP_DIR]:
@@ -70,11 +151,181 @@ for dir_path in [UPLOAD_DIR, OUTPUT_DIR, TEMP_DIR]:
 # Stockage des jobs avec persistance
 jobs: Dict[str, Dict[str, Any]] = load_jobs()
 
-# WebSocket connections pour les notifications
-websocket_connections: Dict[str, WebSocket] = {}
+# Abonnés aux événements de progression (pub/sub en mémoire, une file par WebSocket)
+job_subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+# Sauvegarde différée des jobs: les mises à jour rapprochées sont regroupées
+SAVE_JOBS_DELAY = 0.5  # secondes
+_save_dirty = asyncio.Event()
+
+# Concurrence des traitements: MAX_CONCURRENT_JOBS (env) ou estimation selon la
+# limite mémoire du conteneur moins une réserve pour le serveur, ~200 MB par job,
+# bornée par le quota CPU. Sur 512 MB -> (512 - 300) // 200 = 1.
+JOB_MEMORY_ESTIMATE = 200 * 1024 * 1024
+MEMORY_RESERVE = 300 * 1024 * 1024  # serveur, pool de rendu, cache disque
+LARGE_JOB_SIZE = 50 * 1024 * 1024  # au-delà: un seul gros job à la fois, pas de mode rapide
+CGROUP_MEMORY_LIMIT_FILES = [
+    "/sys/fs/cgroup/memory.max",  # cgroup v2 ("max": pas de limite)
+    "/sys/fs/cgroup/memory/memory.limit_in_bytes",  # v1 (valeur énorme: pas de limite)
+]
+CGROUP_CPU_V2_FILE = "/sys/fs/cgroup/cpu.max"  # "quota période" ou "max période"
+CGROUP_CPU_V1_FILES = ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+
+
+def memory_limit() -> Optional[int]:
+    """Mémoire totale allouable en octets (MemTotal borné par la limite cgroup)
+
+    Une limite fixe plutôt que la mémoire libre au démarrage: au moment de
+    l'import le serveur n'utilise presque rien et surestimerait la place.
+    """
+    limit = None
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    limit = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+    
+    for limit_file in CGROUP_MEMORY_LIMIT_FILES:
+        try:
+            with open(limit_file) as f:
+                cgroup_limit = int(f.read())  # "max" -> ValueError: pas de limite
+        except (OSError, ValueError):
+            continue
+        limit = cgroup_limit if limit is None else min(limit, cgroup_limit)
+        break
+    
+    return limit
+
+
+def cpu_limit() -> int:
+    """Nombre de CPU utilisables: quota CFS du cgroup, sinon CPU visibles"""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    quota = period = None
+    try:
+        with open(CGROUP_CPU_V2_FILE) as f:
+            quota, period = f.read().split()
+    except (OSError, ValueError):
+        try:
+            with open(CGROUP_CPU_V1_FILES[0]) as f:
+                quota = f.read().strip()
+            with open(CGROUP_CPU_V1_FILES[1]) as f:
+                period = f.read().strip()
+        except OSError:
+            pass
+    try:
+        # "max" (v2) ou -1 (v1): pas de quota
+        if quota is not None and int(quota) > 0:
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except ValueError:
+        pass
+    return cpus
+
+
+def estimate_max_concurrent_jobs() -> int:
+    if os.getenv("MAX_CONCURRENT_JOBS"):
+        return max(1, int(os.environ["MAX_CONCURRENT_JOBS"]))
+    limit = memory_limit()
+    if limit is None:
+        return 1
+    return max(1, min((limit - MEMORY_RESERVE) // JOB_MEMORY_ESTIMATE, cpu_limit()))
 
-# Sémaphore globale pour éviter plusieurs encodages simultanés (512MB RAM)
-PROCESSING_SEMAPHORE = asyncio.Semaphore(1)
+
+MAX_CONCURRENT_JOBS = estimate_max_concurrent_jobs()
+LARGE_JOB_LOCK = asyncio.Lock()
+
+# Processus dédiés au calcul (détection + rendu): la boucle reste libre et un
+# manque de mémoire tue le processus enfant, pas le serveur
+RENDER_NICE = 10
+
+# Progression du rendu de chaque worker (0-1), écrite par les processus de rendu et lue ici
+RENDER_PROGRESS = multiprocessing.Array('d', MAX_CONCURRENT_JOBS, lock=False)
+RENDER_PROGRESS_INTERVAL = 0.5  # secondes entre deux lectures de la progression
+RENDER_PROGRESS_START = 60.0  # plage de progression du job couverte par le rendu
+RENDER_PROGRESS_END = 99.0
+
+_render_progress = None
+
+
+def _init_render_process(progress):
+    """Initialisation du processus de rendu: priorité plus basse que l'API"""
+    global _render_progress
+    _render_progress = progress
+    try:
+        os.nice(RENDER_NICE)
+    except OSError:
+        pass
+
+
+def _report_render_progress(slot: int, fraction: float):
+    """Callback de rendu exécuté dans le processus de rendu"""
+    if _render_progress is not None:
+        _render_progress[slot] = fraction
+
+
+def new_render_pool() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=MAX_CONCURRENT_JOBS,
+        initializer=_init_render_process,
+        initargs=(RENDER_PROGRESS,)
+    )
+
+
+RENDER_POOL = new_render_pool()
+
+# File d'attente des traitements, consommée par MAX_CONCURRENT_JOBS workers
+job_queue: asyncio.Queue = asyncio.Queue()
+
+
+class UploadTarget(FileTarget):
+    """FileTarget qui vérifie l'extension et la taille pendant le streaming
+    
+    Les morceaux reçus (~64 KB) sont regroupés en blocs de UPLOAD_WRITE_SIZE:
+    une seule écriture aiofiles (un aller-retour de thread) par bloc.
+    """
+    
+    def __init__(self, filename: str):
+        super().__init__(filename)
+        self.size = 0
+        self.safe_name = None
+        self._buffer = bytearray()
+    
+    async def on_start_async(self):
+        # Ne garder que le nom de base (chemins Windows compris) contre la traversée de répertoires
+        safe_name = Path((self.multipart_filename or "").replace("\\", "/")).name
+        if not safe_name or ".." in safe_name:
+            raise HTTPException(400, "Nom de fichier invalide")
+        if Path(safe_name).suffix.lower() not in ALLOWED_SUFFIXES:
+            raise HTTPException(400, "Format de fichier non supporté")
+        self.safe_name = safe_name
+        await super().on_start_async()
+    
+    async def on_data_received_async(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > MAX_FILE_SIZE:
+            raise HTTPException(413, f"Fichier trop volumineux (max {MAX_FILE_SIZE//1024//1024}MB)")
+        self._buffer += chunk
+        if len(self._buffer) >= UPLOAD_WRITE_SIZE:
+            await self._flush()
+    
+    async def _flush(self):
+        if self._buffer:
+            await super().on_data_received_async(bytes(self._buffer))
+            self._buffer.clear()
+    
+    async def on_finish_async(self):
+        await self._flush()
+        await super().on_finish_async()
+        self._fd = None
+    
+    async def aclose(self):
+        """Ferme le fichier si le parsing a été interrompu"""
+        self._buffer = bytearray()
+        if self._fd:
+            await self._fd.close()
+            self._fd = None
 
 
 class ProcessRequest(BaseModel):
@@ -103,52 +354,108 @@ class JobStatus(BaseModel):
     error: Optional[str] = None
 
 
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles avec Cache-Control (ETag/Last-Modified gérés par Starlette)"""
+    
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = STATIC_CACHE_CONTROL
+        return response
+
+
+# Fichiers statiques servis par Starlette (sendfile + requêtes conditionnelles)
+app.mount("/static", CachedStaticFiles(directory=STATIC_DIR), name="static")
+
+
+# Cache des fichiers statiques: nom -> (contenu, ETag) ou None si absent
+_static_cache: Dict[str, Optional[Tuple[bytes, str]]] = {}
+
+
+async def load_static(name: str) -> Optional[Tuple[bytes, str]]:
+    """Contenu et ETag d'un fichier statique, lus une seule fois par processus"""
+    if name not in _static_cache:
+        try:
+            async with aiofiles.open(STATIC_DIR / name, 'rb') as f:
+                content = await f.read()
+            _static_cache[name] = (content, f'"{hashlib.md5(content).hexdigest()}"')
+        except FileNotFoundError:
+            _static_cache[name] = None
+    return _static_cache[name]
+
+
+async def static_response(request: Request, name: str, media_type: str,
+                    cache_control: str = STATIC_CACHE_CONTROL) -> Optional[Response]:
+    """Réponse en cache pour un fichier statique (304 si l'ETag correspond)"""
+    cached = await load_static(name)
+    if cached is None:
+        return None
+    
+    content, etag = cached
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
 @app.get("/", response_class=HTMLResponse)
-async def home():
+async def home(request: Request):
     """Page d'accueil avec interface simple"""
     # Tracking des visites
     track_page_view()
     print(f"🌐 Page visit at {datetime.now().isoformat()}")
-    html_path = Path(__file__).parent / "static" / "index.html"
-    return HTMLResponse(content=html_path.read_text())
+    # no-cache: le navigateur revalide à chaque visite (304), le tracking reste exact
+    response = await static_response(request, "index.html", "text/html", cache_control="no-cache")
+    if response is None:
+        raise HTTPException(404, "Page non trouvée")
+    return response
 
 
 @app.post("/upload")
 async def upload_video(
-    file: UploadFile = File(...),
-    background_tasks: BackgroundTasks = BackgroundTasks()
+    request: Request,
+    background_tasks: BackgroundTasks
 ) -> Dict[str, str]:
-    """Upload d'une vidéo"""
-    
-    # Vérifications
-    if not file.filename.lower().endswith(('.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4a', '.mp3', '.wav')):
-        raise HTTPException(400, "Format de fichier non supporté")
+    """Upload d'une vidéo
     
-    # Vérifier la taille
-    file_size = 0
-    chunk_size = 1024 * 1024  # 1MB chunks
+    Le corps multipart est parsé au fil de request.stream() et écrit
+    directement sur disque (pas de fichier temporaire spoolé par Starlette).
+    """
     
     # Générer un ID unique
     job_id = str(uuid.uuid4())
-    input_path = UPLOAD_DIR / f"{job_id}_{file.filename}"
+    partial_path = UPLOAD_DIR / f"{job_id}.part"
+    target = UploadTarget(str(partial_path))
     
-    # Sauvegarder le fichier
+    # Sauvegarder le fichier (extension et taille vérifiées pendant le streaming)
     try:
-        async with aiofiles.open(input_path, 'wb') as f:
-            while chunk := await file.read(chunk_size):
-                file_size += len(chunk)
-                if file_size > MAX_FILE_SIZE:
-                    await f.close()
-                    os.remove(input_path)
-                    raise HTTPException(413, f"Fichier trop volumineux (max {MAX_FILE_SIZE//1024//1024}MB)")
-                await f.write(chunk)
+        parser = StreamingFormDataParser(headers=request.headers)
+        parser.register("file", target)
+        async for chunk in request.stream():
+            await parser.adata_received(chunk)
+        if not target.safe_name:
+            raise HTTPException(400, "Aucun fichier reçu")
+    except HTTPException:
+        await target.aclose()
+        partial_path.unlink(missing_ok=True)
+        raise
+    except ParseFailedException as e:
+        # Requête mal formée (pas multipart, boundary absente, corps invalide):
+        # erreur du client, pas du serveur, donc pas comptée dans les erreurs
+        await target.aclose()
+        partial_path.unlink(missing_ok=True)
+        raise HTTPException(400, f"Requête d'upload invalide: {str(e)}")
     except Exception as e:
-        if input_path.exists():
-            input_path.unlink()
+        await target.aclose()
+        partial_path.unlink(missing_ok=True)
         track_error()  # Tracking des erreurs d'upload
         print(f"❌ UPLOAD ERROR: {str(e)}")
         raise HTTPException(500, f"Erreur lors de l'upload: {str(e)}")
     
+    filename = target.safe_name
+    file_size = target.size
+    input_path = UPLOAD_DIR / f"{job_id}_{filename}"
+    partial_path.rename(input_path)
+    
     # Créer le job
     jobs[job_id] = {
         "job_id": job_id,
@@ -157,11 +464,11 @@ async def upload_video(
         "message": "Fichier uploadé, prêt pour le traitement",
         "input_file": str(input_path),
         "output_file": None,
-        "created_at": datetime.now(),
+        "created_at": datetime.now().isoformat(),
         "file_size": file_size,
-        "original_filename": file.filename
+        "original_filename": filename
     }
-    save_jobs(jobs)  # Persister après création
+    schedule_save_jobs()  # Persister après création
     track_upload()  # Tracking
     
     # Programmer le nettoyage automatique
@@ -171,15 +478,14 @@ async def upload_video(
         "job_id": job_id,
         "message": "Upload réussi",
         "file_size": str(file_size),
-        "filename": file.filename
+        "filename": filename
     }
 
 
 @app.post("/process/{job_id}")
 async def process_video(
     job_id: str,
-    params: ProcessRequest,
-    background_tasks: BackgroundTasks
+    params: ProcessRequest
 ) -> JobStatus:
     """Lance le traitement d'une vidéo"""
     
@@ -194,10 +500,10 @@ async def process_video(
     job["status"] = "pending"
     job["message"] = "Traitement en file d'attente..."
     job["params"] = params.dict()
-    save_jobs(jobs)  # Persister après mise à jour
+    schedule_save_jobs()  # Persister après mise à jour
     
-    # Lancer le traitement en arrière-plan
-    background_tasks.add_task(process_video_task, job_id, params)
+    # Mettre le traitement en file d'attente (réponse immédiate)
+    job_queue.put_nowait((job_id, params))
     
     return JobStatus(
         job_id=job_id,
@@ -209,7 +515,143 @@ async def process_video(
     )
 
 
-async def process_video_task(job_id: str, params: ProcessRequest):
+async def processing_worker(slot: int):
+    """Consomme la file d'attente; slot identifie le worker (progression du rendu)"""
+    while True:
+        job_id, params = await job_queue.get()
+        try:
+            job = jobs.get(job_id)
+            if job is not None:
+                # Les petits fichiers passent en parallèle, les gros un par un
+                large = job.get("file_size", 0) >= LARGE_JOB_SIZE
+                async with LARGE_JOB_LOCK if large else nullcontext():
+                    await process_video_task(job_id, params, slot)
+        except Exception as e:
+            print(f"❌ WORKER ERROR {job_id}: {e}")
+        finally:
+            job_queue.task_done()
+
+
+def detect_intervals(input_path: Path, params: ProcessRequest, file_size: int):
+    """Détection des segments audio (bloquant, exécuté hors de la boucle)"""
+    # Créer le détecteur avec les paramètres adaptés
+    # Utiliser la version rapide pour petits fichiers
+    if file_size < LARGE_JOB_SIZE:
+        # Version rapide pour petits fichiers
+        try:
+            from cut_silence_ffmpeg_fast import FFmpegSilenceDetectorFast as FastDetector
+            detector = FastDetector(
+                threshold_db=params.threshold_db,
+                min_silence_duration=params.min_silence_ms / 1000.0,
+                margin_ms=params.margin_ms
+            )
+            return detector.get_audio_segments(str(input_path)), True
+        except ImportError:
+            pass
+    
+    # Version standard
+    try:
+        # Version FFmpeg légère
+        detector = SilenceDetector(
+            threshold_db=params.threshold_db,
+            min_silence_duration=params.min_silence_ms / 1000.0,
+            margin_ms=params.margin_ms
+        )
+        intervals = detector.get_audio_segments(str(input_path))
+    except TypeError:
+        # Version librosa standard
+        detector = SilenceDetector(
+            threshold_db=params.threshold_db,
+            min_silence_ms=params.min_silence_ms,
+            min_noise_ms=params.min_noise_ms,
+            hysteresis_db=params.hysteresis_db,
+            margin_ms=params.margin_ms
+        )
+        intervals = detector.process(str(input_path))
+    return intervals, False
+
+
+def render_video(input_path: Path, output_path: Path, intervals, params: ProcessRequest, use_fast: bool,
+                 slot: int = 0):
+    """Rendu vidéo (bloquant, exécuté hors de la boucle)"""
+    # Utiliser le processeur rapide si applicable
+    os.environ.setdefault('FFMPEG_THREADS', '1')
+    if use_fast:
+        from cut_silence_ffmpeg_fast import FFmpegVideoProcessorFast as FastProcessor
+        processor = FastProcessor(crf=params.crf, audio_bitrate=params.audio_bitrate)
+    else:
+        processor = VideoProcessor(crf=params.crf, audio_bitrate=params.audio_bitrate)
+    processor.render(str(input_path), str(output_path), intervals, progress_cb=partial(_report_render_progress, slot))
+
+
+def _warm_render_process() -> int:
+    """Pré-charge les modules de traitement dans un processus de rendu"""
+    try:
+        import cut_silence_ffmpeg_fast  # noqa: F401
+    except ImportError:
+        pass
+    return os.getpid()
+
+
+async def warm_render_pool():
+    """Lance les processus du pool et importe les modules avant le premier job"""
+    loop = asyncio.get_running_loop()
+    try:
+        pids = await asyncio.gather(*(
+            loop.run_in_executor(RENDER_POOL, _warm_render_process)
+            for _ in range(MAX_CONCURRENT_JOBS)
+        ))
+        print(f"🔥 Render pool ready ({len(set(pids))} process(es))")
+    except Exception as e:
+        print(f"⚠️ Render pool warm-up failed: {e}")
+
+
+async def run_in_render_pool(func, *args):
+    """Exécute func dans RENDER_POOL; un processus tué (OOM) devient MemoryError"""
+    global RENDER_POOL
+    pool = RENDER_POOL
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(pool, func, *args)
+    except BrokenProcessPool:
+        # Le pool est inutilisable après la mort d'un processus: le recréer
+        # (une seule fois si plusieurs jobs en cours échouent ensemble)
+        if pool is RENDER_POOL:
+            pool.shutdown(wait=False)
+            RENDER_POOL = new_render_pool()
+        raise MemoryError("Processus de rendu interrompu")
+
+
+async def render_with_progress(job_id: str, job: dict, slot: int, *args):
+    """Lance render_video et publie la progression réelle de FFmpeg pendant le rendu"""
+    RENDER_PROGRESS[slot] = 0.0
+    render = asyncio.ensure_future(run_in_render_pool(render_video, *args, slot))
+    span = RENDER_PROGRESS_END - RENDER_PROGRESS_START
+    
+    while not render.done():
+        await asyncio.wait({render}, timeout=RENDER_PROGRESS_INTERVAL)
+        progress = round(RENDER_PROGRESS_START + span * RENDER_PROGRESS[slot], 1)
+        if progress > job["progress"]:
+            job["progress"] = progress
+            await notify_progress(job_id, job)
+    
+    return render.result()
+
+
+async def get_duration(file_path: Path) -> float:
+    """Durée d'un média via ffprobe, sans bloquer la boucle"""
+    proc = await asyncio.create_subprocess_exec(
+        'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1', str(file_path),
+        stdout=asyncio.subprocess.PIPE
+    )
+    out, _ = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffprobe a échoué sur {Path(file_path).name}")
+    return float(out.decode().strip())
+
+
+async def process_video_task(job_id: str, params: ProcessRequest, slot: int = 0):
     """Tâche de traitement vidéo en arrière-plan"""
     job = jobs[job_id]
     input_path = Path(job["input_file"])
@@ -218,96 +660,42 @@ async def process_video_task(job_id: str, params: ProcessRequest):
     
     # Optimisation: preset plus rapide pour petits fichiers
     file_size = job.get("file_size", 0)
-    if file_size < 50 * 1024 * 1024:  # < 50MB
+    if file_size < LARGE_JOB_SIZE:
         print(f"🚀 Using fast mode for small file ({file_size/1024/1024:.1f}MB)")
     
-    # S'assurer qu'un seul traitement FFmpeg tourne à la fois
-    await PROCESSING_SEMAPHORE.acquire()
-
     try:
         # Mettre à jour le statut
         job["status"] = "processing"
         job["progress"] = 10.0
         job["message"] = "Analyse de l'audio en cours..."
-        save_jobs(jobs)  # Persister après mise à jour
+        schedule_save_jobs()  # Persister après mise à jour
         await notify_progress(job_id, job)
         
-        # Libérer la mémoire après chaque étape
-        gc.collect()
-        
-        # Créer le détecteur avec les paramètres adaptés
-        # Utiliser la version rapide pour petits fichiers
-        if file_size < 50 * 1024 * 1024:  # < 50MB
-            # Version rapide pour petits fichiers
-            try:
-                from cut_silence_ffmpeg_fast import FFmpegSilenceDetectorFast as FastDetector
-                from cut_silence_ffmpeg_fast import FFmpegVideoProcessorFast as FastProcessor
-                use_fast = True
-                detector = FastDetector(
-                    threshold_db=params.threshold_db,
-                    min_silence_duration=params.min_silence_ms / 1000.0,
-                    margin_ms=params.margin_ms
-                )
-                intervals = detector.get_audio_segments(str(input_path))
-            except ImportError:
-                use_fast = False
-        else:
-            use_fast = False
-        
-        if not use_fast:
-            # Version standard
-            try:
-                # Version FFmpeg légère
-                detector = SilenceDetector(
-                    threshold_db=params.threshold_db,
-                    min_silence_duration=params.min_silence_ms / 1000.0,
-                    margin_ms=params.margin_ms
-                )
-                intervals = detector.get_audio_segments(str(input_path))
-            except TypeError:
-                # Version librosa standard
-                detector = SilenceDetector(
-                    threshold_db=params.threshold_db,
-                    min_silence_ms=params.min_silence_ms,
-                    min_noise_ms=params.min_noise_ms,
-                    hysteresis_db=params.hysteresis_db,
-                    margin_ms=params.margin_ms
-                )
-                intervals = detector.process(str(input_path))
+        # Détection hors du processus serveur pour garder la boucle réactive
+        intervals, use_fast = await run_in_render_pool(detect_intervals, input_path, params, file_size)
         
         # Traitement
         job["progress"] = 30.0
         job["message"] = "Détection des silences..."
-        save_jobs(jobs)
+        schedule_save_jobs()
         await notify_progress(job_id, job)
-        gc.collect()
         
         if not intervals:
             raise ValueError("Aucun segment audio détecté")
         
-        job["progress"] = 60.0
+        job["progress"] = RENDER_PROGRESS_START
         job["message"] = f"Génération de la vidéo ({len(intervals)} segments)..."
-        save_jobs(jobs)
+        schedule_save_jobs()
         await notify_progress(job_id, job)
-        gc.collect()
-        
-        # Rendu vidéo (utiliser le processeur rapide si applicable)
-        os.environ.setdefault('FFMPEG_THREADS', '1')
-        if use_fast:
-            processor = FastProcessor(crf=params.crf, audio_bitrate=params.audio_bitrate)
-        else:
-            processor = VideoProcessor(crf=params.crf, audio_bitrate=params.audio_bitrate)
-        processor.render(str(input_path), str(output_path), intervals)
         
-        # Calculer les statistiques
-        import subprocess
-        def get_duration(file_path):
-            cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
-                   '-of', 'default=noprint_wrappers=1:nokey=1', str(file_path)]
-            return float(subprocess.check_output(cmd).decode().strip())
+        # Rendu vidéo dans le processus de rendu, progression suivie en direct
+        await render_with_progress(job_id, job, slot, input_path, output_path, intervals, params, use_fast)
         
-        duration_original = get_duration(input_path)
-        duration_final = get_duration(output_path)
+        # Calculer les statistiques (deux ffprobe en parallèle)
+        duration_original, duration_final = await asyncio.gather(
+            get_duration(input_path),
+            get_duration(output_path)
+        )
         reduction = (1 - duration_final / duration_original) * 100
         
         # Succès !
@@ -318,68 +706,107 @@ async def process_video_task(job_id: str, params: ProcessRequest):
         job["duration_original"] = duration_original
         job["duration_final"] = duration_final
         job["reduction_percent"] = reduction
-        save_jobs(jobs)
+        schedule_save_jobs()
         
         # Log et tracking
         print(f"✅ VIDEO CONVERTED: {job['original_filename']} | Original: {duration_original:.1f}s | Final: {duration_final:.1f}s | Reduction: {reduction:.1f}%")
         track_video_processed(duration_original, duration_final)
         
         await notify_progress(job_id, job)
-        gc.collect()
         
     except MemoryError:
         job["status"] = "failed"
         job["progress"] = 0.0
         job["message"] = "Fichier trop volumineux pour le plan actuel"
         job["error"] = "Mémoire insuffisante. Essayez un fichier plus petit (max 50MB)."
-        save_jobs(jobs)
+        schedule_save_jobs()
         track_error()  # Tracking ajouté
         await notify_progress(job_id, job)
         print(f"❌ MEMORY ERROR {job_id}")
-        gc.collect()
     except Exception as e:
         job["status"] = "failed"
         job["progress"] = 0.0
         job["message"] = "Échec du traitement"
         job["error"] = str(e)
-        save_jobs(jobs)
+        schedule_save_jobs()
         track_error()  # Tracking
         await notify_progress(job_id, job)
         print(f"❌ PROCESSING ERROR {job_id}: {e}")
-        gc.collect()
     finally:
-        # Libérer le sémaphore quoi qu'il arrive
-        try:
-            PROCESSING_SEMAPHORE.release()
-        except Exception:
-            pass
+        # Une seule collecte en fin de job, et rendre la mémoire libérée au système
+        release_memory()
 
 
-@app.get("/status/{job_id}")
-async def get_job_status(job_id: str) -> JobStatus:
-    """Récupère le statut d'un job"""
+@app.get("/status/{job_id}", response_model=JobStatus)
+async def get_job_status(job_id: str, request: Request) -> Response:
+    """Récupère le statut d'un job
     
-    if job_id not in jobs:
+    Endpoint interrogé en boucle par le frontend: le dict est sérialisé
+    directement par orjson, sans construire ni valider un JobStatus
+    (le schéma reste documenté via response_model). Un statut inchangé
+    depuis le dernier appel (If-None-Match) renvoie un 304 sans corps.
+    """
+    
+    job = jobs.get(job_id)
+    if job is None:
         raise HTTPException(404, "Job non trouvé")
     
-    job = jobs[job_id]
-    return JobStatus(
-        job_id=job_id,
-        status=job["status"],
-        progress=job.get("progress", 0),
-        message=job.get("message", ""),
-        input_file=job.get("original_filename", ""),
-        output_file=job.get("output_file"),
-        created_at=job["created_at"],
-        duration_original=job.get("duration_original"),
-        duration_final=job.get("duration_final"),
-        reduction_percent=job.get("reduction_percent"),
-        error=job.get("error")
-    )
+    # no-cache: le navigateur revalide à chaque poll avec l'ETag
+    state = f"{job['status']}:{job.get('progress', 0)}:{job.get('message', '')}"
+    headers = {"ETag": f'"{hashlib.md5(state.encode()).hexdigest()}"', "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    
+    return ORJSONResponse({
+        "job_id": job_id,
+        "status": job["status"],
+        "progress": float(job.get("progress", 0)),
+        "message": job.get("message", ""),
+        "input_file": job.get("original_filename", ""),
+        "output_file": job.get("output_file"),
+        "created_at": job["created_at"],
+        "duration_original": job.get("duration_original"),
+        "duration_final": job.get("duration_final"),
+        "reduction_percent": job.get("reduction_percent"),
+        "error": job.get("error")
+    }, headers=headers)
+
+
+def parse_range(range_header: str, file_size: int) -> Optional[tuple]:
+    """Parse un en-tête Range à plage unique -> (début, fin incluse) ou None si non satisfiable"""
+    start, end = RANGE_RE.match(range_header.strip()).groups()
+    if start == end == "":
+        return None
+    
+    if start == "":
+        # Suffixe: les N derniers octets
+        length = int(end)
+        if length == 0:
+            return None
+        return max(file_size - length, 0), file_size - 1
+    
+    start = int(start)
+    end = min(int(end), file_size - 1) if end else file_size - 1
+    if start > end:
+        return None
+    return start, end
+
+
+async def iter_file_range(path: Path, start: int, end: int):
+    """Lit [start, end] par blocs sans charger le fichier en mémoire"""
+    remaining = end - start + 1
+    async with aiofiles.open(path, 'rb') as f:
+        await f.seek(start)
+        while remaining > 0:
+            chunk = await f.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
 
 
 @app.get("/download/{job_id}")
-async def download_result(job_id: str):
+async def download_result(job_id: str, request: Request):
     """Télécharge le résultat traité"""
     
     if job_id not in jobs:
@@ -396,10 +823,38 @@ async def download_result(job_id: str):
     original_name = Path(job["original_filename"]).stem
     download_name = f"{original_name}_silencut.mp4"
     
+    stat_result = os.stat(output_path)
+    file_size = stat_result.st_size
+    headers = {"Accept-Ranges": "bytes"}
+    
+    # Reprise de téléchargement / lecture partielle (Starlette ne gère pas Range)
+    # Un en-tête Range non reconnu (multi-plages, autre unité) est ignoré
+    range_header = request.headers.get("range", "")
+    if RANGE_RE.match(range_header.strip()):
+        byte_range = parse_range(range_header, file_size)
+        if byte_range is None:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{file_size}"})
+        
+        start, end = byte_range
+        headers.update({
+            "Content-Range": f"bytes {start}-{end}/{file_size}",
+            "Content-Length": str(end - start + 1),
+            "Content-Disposition": f"attachment; filename*=utf-8''{quote(download_name)}"
+        })
+        return StreamingResponse(
+            iter_file_range(output_path, start, end),
+            status_code=206,
+            media_type="video/mp4",
+            headers=headers
+        )
+    
+    # Fichier complet: FileResponse passe par sendfile quand le serveur le permet
     return FileResponse(
         output_path,
         media_type="video/mp4",
-        filename=download_name
+        filename=download_name,
+        stat_result=stat_result,
+        headers=headers
     )
 
 
@@ -407,40 +862,88 @@ async def download_result(job_id: str):
 async def websocket_endpoint(websocket: WebSocket, job_id: str):
     """WebSocket pour les notifications en temps réel"""
     await websocket.accept()
-    websocket_connections[job_id] = websocket
+    
+    # S'abonner avant d'envoyer le statut initial pour ne rater aucun événement
+    queue: asyncio.Queue = asyncio.Queue()
+    job_subscribers.setdefault(job_id, set()).add(queue)
+    
+    # La réception en parallèle détecte la déconnexion sans attendre le
+    # prochain événement; aucune attente active entre deux messages
+    event_task = asyncio.create_task(queue.get())
+    receive_task = asyncio.create_task(websocket.receive())
     
     try:
         # Envoyer le statut initial
         if job_id in jobs:
-            job_data = jobs[job_id].copy()
-            job_data["created_at"] = job_data["created_at"].isoformat() if "created_at" in job_data else None
-            await websocket.send_json(job_data)
+            await websocket.send_text(serialize_job(jobs[job_id]))
         
-        # Garder la connexion ouverte
+        # Relayer les événements publiés par notify_progress
         while True:
-            await asyncio.sleep(1)
+            done, _ = await asyncio.wait(
+                {event_task, receive_task},
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if event_task in done:
+                await websocket.send_text(event_task.result())
+                event_task = asyncio.create_task(queue.get())
+            if receive_task in done:
+                if receive_task.result()["type"] == "websocket.disconnect":
+                    break
+                # Message client ignoré: continuer à écouter
+                receive_task = asyncio.create_task(websocket.receive())
             
     except WebSocketDisconnect:
-        del websocket_connections[job_id]
+        pass
+    finally:
+        event_task.cancel()
+        receive_task.cancel()
+        subscribers = job_subscribers.get(job_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del job_subscribers[job_id]
+
+
+def serialize_job(job_data: dict) -> str:
+    """Job sérialisé en JSON (sans copie)"""
+    return orjson.dumps(job_data).decode()
 
 
 async def notify_progress(job_id: str, job_data: dict):
-    """Notifie les clients WebSocket du progrès"""
-    if job_id in websocket_connections:
+    """Publie le progrès d'un job à tous ses abonnés WebSocket"""
+    subscribers = job_subscribers.get(job_id)
+    if not subscribers:
+        return
+    
+    # Une seule sérialisation par événement, partagée entre les abonnés
+    message = serialize_job(job_data)
+    for queue in subscribers:
+        queue.put_nowait(message)
+
+
+def schedule_save_jobs():
+    """Demande une sauvegarde des jobs (écrite par jobs_flush_loop)"""
+    _save_dirty.set()
+
+
+async def jobs_flush_loop():
+    """Écrit les jobs sur disque au plus une fois par SAVE_JOBS_DELAY"""
+    while True:
+        await _save_dirty.wait()
+        await asyncio.sleep(SAVE_JOBS_DELAY)
+        _save_dirty.clear()
         try:
-            # Convertir les datetime en string pour la sérialisation JSON
-            safe_data = job_data.copy()
-            if "created_at" in safe_data and hasattr(safe_data["created_at"], "isoformat"):
-                safe_data["created_at"] = safe_data["created_at"].isoformat()
-            await websocket_connections[job_id].send_json(safe_data)
+            # fsync hors de la boucle d'événements. packb parcourt le dict en C
+            # sans relâcher le GIL: il voit un état cohérent des jobs
+            await asyncio.to_thread(save_jobs, jobs)
         except Exception as e:
-            print(f"Erreur WebSocket pour job {job_id}: {e}")
-            del websocket_connections[job_id]
+            print(f"❌ SAVE JOBS ERROR: {e}")
 
 
 async def cleanup_old_files():
     """Nettoie les vieux fichiers"""
-    cutoff = datetime.now() - timedelta(hours=CLEANUP_AFTER_HOURS)
+    # created_at est une chaîne ISO: l'ordre lexicographique est chronologique
+    cutoff = (datetime.now() - timedelta(hours=CLEANUP_AFTER_HOURS)).isoformat()
     
     for job_id, job in list(jobs.items()):
         if job["created_at"] < cutoff:
@@ -454,14 +957,13 @@ async def cleanup_old_files():
             # Supprimer le job
             del jobs[job_id]
     
-    save_jobs(jobs)  # Persister après nettoyage
-    gc.collect()  # Libérer la mémoire
+    schedule_save_jobs()  # Persister après nettoyage
 
 
-@app.get("/health")
-async def health_check():
+@app.get("/health", response_class=ORJSONResponse)
+async def health_check() -> ORJSONResponse:
     """Health check endpoint"""
-    return {"status": "healthy", "jobs_count": len(jobs)}
+    return ORJSONResponse({"status": "healthy", "jobs_count": len(jobs)})
 
 
 @app.get("/stats")
@@ -471,20 +973,20 @@ async def get_stats():
 
 
 @app.get("/sitemap.xml", response_class=PlainTextResponse)
-async def sitemap():
+async def sitemap(request: Request):
     """Serve sitemap.xml for SEO"""
-    sitemap_path = Path(__file__).parent / "static" / "sitemap.xml"
-    if sitemap_path.exists():
-        return PlainTextResponse(content=sitemap_path.read_text(), media_type="application/xml")
+    response = await static_response(request, "sitemap.xml", "application/xml")
+    if response is not None:
+        return response
     raise HTTPException(404, "Sitemap not found")
 
 
 @app.get("/robots.txt", response_class=PlainTextResponse)
-async def robots():
+async def robots(request: Request):
     """Serve robots.txt for SEO"""
-    robots_path = Path(__file__).parent / "static" / "robots.txt"
-    if robots_path.exists():
-        return PlainTextResponse(content=robots_path.read_text())
+    response = await static_response(request, "robots.txt", "text/plain")
+    if response is not None:
+        return response
     raise HTTPException(404, "Robots.txt not found")
 
 
@@ -499,5 +1001,12 @@ if __name__ == "__main__":
     # Forcer un garbage collection au démarrage
     gc.collect()
     
+    # Un seul worker par défaut: jobs, file d'attente et abonnés WebSocket
+    # vivent dans la mémoire du processus et ne sont pas partagés
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    
     print(f"🚀 Démarrage de SilenCut avec {len(jobs)} jobs restaurés")
-    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=False)
\ No newline at end of file
+    uvicorn.run(
+        "app:app", host="0.0.0.0", port=8000, reload=False,
+        loop="uvloop", http="httptools", workers=workers
+    )
\ No newline at end of file
@@ -3,141 +3,389 @@
 Système de tracking avec historique journalier persistant
 """
 
-import json
-from datetime import datetime, date
+import atexit
+import fcntl
+import gzip
+import os
+import threading
+import time
+from datetime import datetime, date, timedelta
 from pathlib import Path
 from typing import Dict, Any
 
+import orjson
+
 STATS_FILE = Path("webapp/stats_history.json")
 
+# Journal des événements (une ligne JSON par événement), replié périodiquement
+# dans STATS_FILE puis vidé
+EVENTS_FILE = STATS_FILE.with_name("stats_events.jsonl")
+
+# Jours plus anciens que HOT_DAYS: déplacés dans une archive compressée au repli
+# (les totaux courants "_totals" les comptent toujours)
+HOT_DAYS = 90
+ARCHIVE_FILE = STATS_FILE.with_name("stats_archive.json.gz")
+
+# Stats en mémoire: relues seulement si le fichier ou le journal a changé sur disque
+_STATS_CACHE: Dict[str, Any] = None
+_STATS_MTIME = None
+_STATS_LOCK = threading.RLock()
+
+# Sérialise les accès disque de ce processus (ajouts, relectures, replis).
+# _STATS_LOCK ne protège que la mémoire et n'est jamais tenu pendant une I/O:
+# ordre de prise _IO_LOCK puis _STATS_LOCK, jamais l'inverse
+_IO_LOCK = threading.RLock()
+
+# Version des stats en cache, incrémentée à chaque changement: le résumé
+# n'est recalculé que si elle (ou le jour) a changé
+_STATS_VERSION = 0
+_SUMMARY_CACHE = None
+_SUMMARY_KEY = None
+
+# Compteurs d'une journée
+_DAY_KEYS = ("page_views", "videos_processed", "total_seconds_saved", "uploads", "errors")
+
+# Totaux courants stockés sous "_totals" (les clés "_" ne sont pas des jours)
+TOTAL_KEYS = ("page_views", "videos_processed", "total_seconds_saved", "uploads")
+
+# Repli différé: les événements sont déjà sur disque dans le journal,
+# le fichier complet n'est réécrit qu'au plus une fois par intervalle
+ROLLUP_DELAY = 60.0  # secondes
+_DIRTY = threading.Event()
+
+# Événements en attente d'ajout au journal: le thread d'écriture les regroupe
+# en un seul write, le thread de la requête ne fait aucune I/O
+APPEND_DELAY = 0.05  # secondes
+_PENDING_LINES = []
+_PENDING = threading.Event()
+_WRITER = None
+
+# Pause du thread d'écriture après une erreur (disque plein, droits...) avant de réessayer
+WRITER_RETRY_DELAY = 5.0  # secondes
+
+# Clé du jour mémorisée jusqu'à minuit
+_TODAY_KEY = None
+_TODAY_EXPIRES = 0.0
+
 def get_today_key():
     """Retourne la clé du jour actuel"""
-    return date.today().isoformat()
+    global _TODAY_KEY, _TODAY_EXPIRES
+    now = time.time()
+    if now >= _TODAY_EXPIRES:
+        today = date.today()
+        _TODAY_KEY = today.isoformat()
+        _TODAY_EXPIRES = datetime.combine(today + timedelta(days=1), datetime.min.time()).timestamp()
+    return _TODAY_KEY
 
-def load_stats() -> Dict[str, Any]:
-    """Charge les stats depuis le fichier"""
-    if STATS_FILE.exists():
-        try:
-            with open(STATS_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+def _file_mtime():
+    """État disque (mtime des stats, taille du journal) pour valider le cache"""
+    try:
+        mtime = STATS_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    try:
+        log_size = EVENTS_FILE.stat().st_size
+    except FileNotFoundError:
+        log_size = 0
+    return mtime, log_size
 
-def save_stats(stats: Dict[str, Any]):
-    """Sauvegarde les stats dans le fichier"""
+def _open_events():
+    """Ouvre le journal (créé au besoin); flock dessus coordonne les workers:
+    LOCK_SH pour ajouter ou lire, LOCK_EX pour le repli"""
     STATS_FILE.parent.mkdir(exist_ok=True)
-    with open(STATS_FILE, 'w') as f:
-        json.dump(stats, f, indent=2)
+    return open(EVENTS_FILE, 'a+b')
 
-def track_page_view():
-    """Enregistre une vue de page"""
-    stats = load_stats()
-    today = get_today_key()
+def _read_stats(events) -> Dict[str, Any]:
+    """Lit le dernier repli puis rejoue le journal des événements (verrouillé)"""
+    # Un seul open, pas de exists() préalable
+    try:
+        with open(STATS_FILE, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        data = None
     
-    if today not in stats:
-        stats[today] = {
-            "page_views": 0,
-            "videos_processed": 0,
-            "total_seconds_saved": 0,
-            "uploads": 0,
-            "errors": 0
-        }
+    stats = {}
+    if data is not None:
+        try:
+            stats = orjson.loads(data)
+        except orjson.JSONDecodeError as e:
+            # Garder le fichier illisible pour inspection au lieu de l'écraser
+            corrupt = STATS_FILE.with_name(STATS_FILE.name + ".corrupt")
+            os.replace(STATS_FILE, corrupt)
+            print(f"❌ STATS FILE CORRUPT ({e}), moved to {corrupt}")
+    _ensure_totals(stats)
     
-    stats[today]["page_views"] += 1
-    save_stats(stats)
+    events.seek(0)
+    for line in events:
+        try:
+            event = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            # Ligne tronquée par un crash pendant l'ajout
+            print(f"⚠️ Skipping invalid stats event: {line!r}")
+            continue
+        _apply_event(stats, event["d"], event["k"], event["v"])
+    return stats
 
-def track_video_processed(duration_original: float, duration_final: float):
-    """Enregistre une vidéo traitée"""
-    stats = load_stats()
-    today = get_today_key()
+def load_stats() -> Dict[str, Any]:
+    """Charge les stats (dict en cache, partagé: muter sous _STATS_LOCK)"""
+    state = _file_mtime()
+    with _STATS_LOCK:
+        if _STATS_CACHE is not None and state == _STATS_MTIME:
+            return _STATS_CACHE
     
-    if today not in stats:
-        stats[today] = {
-            "page_views": 0,
-            "videos_processed": 0,
-            "total_seconds_saved": 0,
-            "uploads": 0,
-            "errors": 0
+    with _IO_LOCK:
+        # Verrou partagé: pas de lecture au milieu d'un repli d'un autre worker
+        with _open_events() as events:
+            fcntl.flock(events, fcntl.LOCK_SH)
+            stats = _read_stats(events)
+            state = _file_mtime()
+        return _install_cache(stats, state)
+
+def _install_cache(stats: Dict[str, Any], state) -> Dict[str, Any]:
+    """Remplace le cache par des stats relues du disque (sous _IO_LOCK)"""
+    global _STATS_CACHE, _STATS_MTIME, _STATS_VERSION
+    with _STATS_LOCK:
+        # Événements enregistrés pendant la lecture: dans l'ancien cache et
+        # en file, mais pas encore sur disque
+        for chunk in _PENDING_LINES:
+            for line in chunk.splitlines():
+                event = orjson.loads(line)
+                _apply_event(stats, event["d"], event["k"], event["v"])
+        _STATS_CACHE, _STATS_MTIME = stats, state
+        _STATS_VERSION += 1
+        return stats
+
+def _ensure_totals(stats: Dict[str, Any]):
+    """Calcule les totaux courants d'un fichier qui n'en a pas encore"""
+    if "_totals" not in stats:
+        # Un seul passage sur les jours (qui ont toujours toutes les clés)
+        views = videos = saved = uploads = 0
+        for key, day in stats.items():
+            if key.startswith("_"):
+                continue
+            views += day["page_views"]
+            videos += day["videos_processed"]
+            saved += day["total_seconds_saved"]
+            uploads += day["uploads"]
+        stats["_totals"] = {
+            "page_views": views,
+            "videos_processed": videos,
+            "total_seconds_saved": saved,
+            "uploads": uploads
         }
+
+def save_stats(stats: Dict[str, Any]):
+    """Sauvegarde les stats dans le fichier (le cache se recale au prochain load_stats)"""
+    with _IO_LOCK:
+        STATS_FILE.parent.mkdir(exist_ok=True)
+        # Sérialisation orjson en bytes puis une seule écriture, atomique:
+        # un crash pendant l'écriture laisse l'ancien fichier intact
+        data = orjson.dumps(stats, option=orjson.OPT_INDENT_2)
+        tmp_file = STATS_FILE.with_name(STATS_FILE.name + ".tmp")
+        with open(tmp_file, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, STATS_FILE)
+
+def _archive_old_days(stats: Dict[str, Any]):
+    """Déplace les jours au-delà de HOT_DAYS dans ARCHIVE_FILE"""
+    days = sorted(key for key in stats if not key.startswith("_"))  # ISO: ordre chronologique
+    if len(days) <= HOT_DAYS:
+        return
+    
+    try:
+        with gzip.open(ARCHIVE_FILE, 'rb') as f:
+            archive = orjson.loads(f.read())
+    except FileNotFoundError:
+        archive = {}
+    except (gzip.BadGzipFile, EOFError, orjson.JSONDecodeError) as e:
+        # Archive illisible: la mettre de côté plutôt que de bloquer tous les replis
+        corrupt = ARCHIVE_FILE.with_name(ARCHIVE_FILE.name + ".corrupt")
+        os.replace(ARCHIVE_FILE, corrupt)
+        print(f"❌ STATS ARCHIVE CORRUPT ({e}), moved to {corrupt}")
+        archive = {}
+    for day in days[:-HOT_DAYS]:
+        archive[day] = stats[day]
     
-    stats[today]["videos_processed"] += 1
-    stats[today]["total_seconds_saved"] += (duration_original - duration_final)
-    save_stats(stats)
+    # Archive écrite (atomiquement) avant de retirer les jours des stats:
+    # un crash entre les deux ne fait que réarchiver les mêmes jours
+    tmp_file = ARCHIVE_FILE.with_name(ARCHIVE_FILE.name + ".tmp")
+    with open(tmp_file, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+            f.write(orjson.dumps(archive))
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_file, ARCHIVE_FILE)
+    
+    for day in days[:-HOT_DAYS]:
+        del stats[day]
+
+def _fresh_day() -> Dict[str, Any]:
+    return dict.fromkeys(_DAY_KEYS, 0)
+
+def _apply_event(stats: Dict[str, Any], day_key: str, key: str, amount):
+    """Applique un événement aux compteurs du jour et aux totaux"""
+    day = stats.get(day_key)
+    if day is None:
+        day = stats[day_key] = _fresh_day()
+    day[key] = day.get(key, 0) + amount
+    if key in TOTAL_KEYS:
+        stats["_totals"][key] += amount
+
+def _record(*events):
+    """Ajoute des événements (clé, montant) au cache et à la file du journal
+    
+    Mémoire seulement: ni I/O ni stat sur le chemin de la requête.
+    """
+    global _STATS_VERSION
+    if _STATS_CACHE is None:
+        load_stats()  # Préchargement à l'import en échec
+    with _STATS_LOCK:
+        stats = _STATS_CACHE
+        today = get_today_key()
+        for key, amount in events:
+            _apply_event(stats, today, key, amount)
+            _PENDING_LINES.append(orjson.dumps({"d": today, "k": key, "v": amount}) + b"\n")
+        _STATS_VERSION += 1
+        _schedule_save()
+
+def _write_events():
+    """Ajoute les événements en attente au journal, en un seul write"""
+    global _STATS_MTIME
+    with _IO_LOCK:
+        # File vidée sous _STATS_LOCK, écriture hors de ce verrou: un track_*
+        # n'attend jamais le disque ni le LOCK_EX d'un autre worker
+        with _STATS_LOCK:
+            _PENDING.clear()
+            if not _PENDING_LINES:
+                return
+            data = b"".join(_PENDING_LINES)
+            _PENDING_LINES.clear()
+        
+        # Quelques dizaines d'octets par événement au lieu de réécrire tout
+        # l'historique; les ajouts O_APPEND des workers partagent le verrou
+        try:
+            with _open_events() as f:
+                fcntl.flock(f, fcntl.LOCK_SH)
+                f.write(data)
+                f.flush()
+        except BaseException:
+            # Remettre les événements en file pour le prochain essai
+            with _STATS_LOCK:
+                _PENDING_LINES.insert(0, data)
+                _PENDING.set()
+            raise
+        
+        # Le cache contient déjà ces événements: avancer la taille attendue du
+        # journal de nos octets (un ajout d'un autre worker forcera la relecture)
+        with _STATS_LOCK:
+            if _STATS_MTIME is not None:
+                mtime, log_size = _STATS_MTIME
+                _STATS_MTIME = mtime, log_size + len(data)
+
+def _schedule_save():
+    """Marque un ajout et un repli à faire; le thread d'écriture démarre au premier appel"""
+    global _WRITER
+    _DIRTY.set()
+    _PENDING.set()
+    if _WRITER is None:
+        _WRITER = threading.Thread(target=_writer_loop, name="stats-writer", daemon=True)
+        _WRITER.start()
+
+def _writer_loop():
+    rollup_at = None
+    while True:
+        try:
+            # Attendre des événements, ou l'heure du repli s'il y en a un de prévu
+            timeout = None if rollup_at is None else max(0.0, rollup_at - time.monotonic())
+            if _PENDING.wait(timeout):
+                # Laisser les événements rapprochés s'accumuler avant d'écrire
+                time.sleep(APPEND_DELAY)
+                _write_events()
+                if rollup_at is None:
+                    rollup_at = time.monotonic() + ROLLUP_DELAY
+            if rollup_at is not None and time.monotonic() >= rollup_at:
+                flush()
+                rollup_at = None
+        except Exception as e:
+            # Le thread ne redémarre pas: journaliser et réessayer plus tard
+            print(f"❌ STATS WRITER ERROR: {e}")
+            time.sleep(WRITER_RETRY_DELAY)
+
+def flush():
+    """Replie le journal dans le fichier de stats puis le vide
+    (thread d'écriture et sortie du processus)"""
+    with _IO_LOCK:
+        if not _DIRTY.is_set():
+            return
+        _DIRTY.clear()
+        try:
+            _write_events()
+            # Relire le disque plutôt que le cache: le journal peut contenir
+            # les événements d'autres workers. Verrou exclusif jusqu'au vidage
+            # du journal pour qu'aucun événement ne soit perdu ni compté deux fois
+            with _open_events() as events:
+                fcntl.flock(events, fcntl.LOCK_EX)
+                stats = _read_stats(events)
+                _archive_old_days(stats)
+                save_stats(stats)
+                events.truncate(0)
+                state = _file_mtime()
+        except BaseException:
+            # Repli à refaire au prochain passage
+            _DIRTY.set()
+            raise
+        _install_cache(stats, state)
+
+atexit.register(flush)
+
+def track_page_view():
+    """Enregistre une vue de page"""
+    _record(("page_views", 1))
+
+def track_video_processed(duration_original: float, duration_final: float):
+    """Enregistre une vidéo traitée"""
+    _record(("videos_processed", 1),
+            ("total_seconds_saved", duration_original - duration_final))
 
 def track_upload():
     """Enregistre un upload"""
-    stats = load_stats()
-    today = get_today_key()
-    
-    if today not in stats:
-        stats[today] = {
-            "page_views": 0,
-            "videos_processed": 0,
-            "total_seconds_saved": 0,
-            "uploads": 0,
-            "errors": 0
-        }
-    
-    stats[today]["uploads"] += 1
-    save_stats(stats)
+    _record(("uploads", 1))
 
 def track_error():
     """Enregistre une erreur"""
-    stats = load_stats()
-    today = get_today_key()
-    
-    if today not in stats:
-        stats[today] = {
-            "page_views": 0,
-            "videos_processed": 0,
-            "total_seconds_saved": 0,
-            "uploads": 0,
-            "errors": 0
-        }
-    
-    stats[today]["errors"] += 1
-    save_stats(stats)
+    _record(("errors", 1))
 
 def get_stats_summary():
-    """Retourne un résumé des stats"""
-    stats = load_stats()
-    
+    """Retourne un résumé des stats (mémorisé tant que rien n'a changé)"""
+    global _SUMMARY_CACHE, _SUMMARY_KEY
+    load_stats()  # Hors _STATS_LOCK: peut relire le disque
+    with _STATS_LOCK:
+        key = (_STATS_VERSION, get_today_key())
+        if _SUMMARY_KEY != key:
+            _SUMMARY_CACHE, _SUMMARY_KEY = _build_summary(_STATS_CACHE, key[1]), key
+        return _SUMMARY_CACHE
+
+def _build_summary(stats: Dict[str, Any], today: str) -> Dict[str, Any]:
+    """Calcule le résumé des stats"""
     # Stats du jour
-    today = get_today_key()
-    today_stats = stats.get(today, {
-        "page_views": 0,
-        "videos_processed": 0,
-        "total_seconds_saved": 0,
-        "uploads": 0,
-        "errors": 0
-    })
+    today_stats = stats.get(today) or _fresh_day()
     
-    # Stats totales
-    total_views = sum(day.get("page_views", 0) for day in stats.values())
-    total_videos = sum(day.get("videos_processed", 0) for day in stats.values())
-    total_saved = sum(day.get("total_seconds_saved", 0) for day in stats.values())
-    total_uploads = sum(day.get("uploads", 0) for day in stats.values())
+    # Stats totales (tenues à jour par les track_*)
+    totals = stats["_totals"]
+    total_views = totals["page_views"]
+    total_videos = totals["videos_processed"]
+    total_saved = totals["total_seconds_saved"]
+    total_uploads = totals["uploads"]
     
     # Historique des 7 derniers jours
-    from datetime import timedelta
+    today_date = date.fromisoformat(today)
+    empty_day = _fresh_day()
     last_7_days = []
     for i in range(7):
-        day = (date.today() - timedelta(days=i)).isoformat()
-        if day in stats:
-            last_7_days.append({
-                "date": day,
-                **stats[day]
-            })
-        else:
-            last_7_days.append({
-                "date": day,
-                "page_views": 0,
-                "videos_processed": 0,
-                "total_seconds_saved": 0,
-                "uploads": 0,
-                "errors": 0
-            })
+        day = (today_date - timedelta(days=i)).isoformat()
+        last_7_days.append({"date": day, **stats.get(day, empty_day)})
     
     return {
         "today": today_stats,
@@ -150,5 +398,11 @@ def get_stats_summary():
             "uploads": total_uploads
         },
         "last_7_days": last_7_days,
-        "all_time_data": stats
-    }
\ No newline at end of file
+        "all_time_data": {key: day for key, day in stats.items() if not key.startswith("_")}
+    }
+
+# Préchargement à l'import: le premier événement ne paie pas la lecture du fichier
+try:
+    load_stats()
+except OSError as e:
+    print(f"⚠️ Could not preload stats: {e}")
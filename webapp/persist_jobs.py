@@ -1,36 +1,46 @@
 """
 Persister les jobs sur disque pour survivre aux redémarrages
 """
-import json
 import os
+import threading
+import msgpack
+import orjson
 from pathlib import Path
-from datetime import datetime
 
-JOBS_FILE = Path("jobs.json")
+JOBS_FILE = Path("jobs.msgpack")
+
+# Ancien format JSON, relu une seule fois pour migrer vers msgpack
+LEGACY_JOBS_FILE = Path("jobs.json")
+
+# save_jobs tourne dans un thread: une seule écriture du fichier temporaire à la fois
+_SAVE_LOCK = threading.Lock()
 
 def save_jobs(jobs):
-    """Sauvegarde les jobs sur disque"""
-    jobs_serializable = {}
-    for job_id, job in jobs.items():
-        job_copy = job.copy()
-        if 'created_at' in job_copy and isinstance(job_copy['created_at'], datetime):
-            job_copy['created_at'] = job_copy['created_at'].isoformat()
-        jobs_serializable[job_id] = job_copy
+    """Sauvegarde les jobs sur disque (msgpack)
     
-    with open(JOBS_FILE, 'w') as f:
-        json.dump(jobs_serializable, f)
+    created_at est stocké en chaîne ISO 8601: aucune conversion à l'aller
+    ni au retour.
+    """
+    # Écriture atomique: un crash pendant l'écriture laisse l'ancien fichier intact
+    tmp_file = JOBS_FILE.with_name(JOBS_FILE.name + ".tmp")
+    with _SAVE_LOCK:
+        with open(tmp_file, 'wb') as f:
+            f.write(msgpack.packb(jobs))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, JOBS_FILE)
 
 def load_jobs():
     """Charge les jobs depuis le disque"""
-    if not JOBS_FILE.exists():
-        return {}
+    try:
+        with open(JOBS_FILE, 'rb') as f:
+            return msgpack.unpackb(f.read())
+    except FileNotFoundError:
+        pass
     
-    with open(JOBS_FILE, 'r') as f:
-        jobs = json.load(f)
-    
-    # Reconvertir les dates
-    for job_id, job in jobs.items():
-        if 'created_at' in job and isinstance(job['created_at'], str):
-            job['created_at'] = datetime.fromisoformat(job['created_at'])
-    
-    return jobs
\ No newline at end of file
+    # Migration: le prochain save_jobs écrit jobs.msgpack, qui prend le relais
+    try:
+        with open(LEGACY_JOBS_FILE, 'rb') as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return {}